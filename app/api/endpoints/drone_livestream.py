@@ -3,6 +3,7 @@ import os, time
 from fastapi import APIRouter, Request, HTTPException
 from app.services.security import enforce_api_key, enforce_lan_only
 from app.api.endpoints.drone_sse import enqueue_command
+from app.services.event_feed import feed
 
 router = APIRouter()
 
@@ -25,6 +26,7 @@ async def livestream_start(request: Request, body: dict):
 
     await enqueue_command(device_id=device_id, cmd_type="LIVESTREAM_START", payload={"rtmp_url": rtmp_url})
     _live[device_id] = {"rtmp_url": rtmp_url, "started_at_ms": int(time.time() * 1000)}
+    feed.publish("livestream", {"status": "started", **_live[device_id]}, device_id=device_id)
 
     resp = {"ok": True, "device_id": device_id, "rtmp_url": rtmp_url}
     if PLAY_BASE:
@@ -40,10 +42,19 @@ async def livestream_stop(request: Request, body: dict):
     device_id = (body.get("device_id") or "android-controller-01").strip()
     await enqueue_command(device_id=device_id, cmd_type="LIVESTREAM_STOP", payload={})
     _live.pop(device_id, None)
+    feed.publish("livestream", {"status": "stopped"}, device_id=device_id)
     return {"ok": True, "device_id": device_id}
 
 @router.get("/v1/drone/livestream/status")
 async def livestream_status(request: Request, device_id: str = "android-controller-01"):
     enforce_lan_only(request)
     enforce_api_key(request)
-    return {"ok": True, "device_id": device_id, "state": _live.get(device_id)}
\ No newline at end of file
+    return {"ok": True, "device_id": device_id, "state": _live.get(device_id)}
+
+# ---- warm restart ----
+
+def export_state() -> dict:
+    return {"live": dict(_live)}
+
+def restore_state(state: dict) -> None:
+    _live.update(state.get("live") or {})
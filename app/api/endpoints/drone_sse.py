@@ -7,16 +7,31 @@ from typing import Dict, Set, Optional
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import StreamingResponse
 from app.services.security import enforce_api_key, enforce_lan_only
+from app.services.event_feed import feed
+from app.services.sse_broker import CommandQueue, drop_stats, is_safety
+from app.services.tracing import tracer
 
 router = APIRouter()
 
 # device_id -> set of subscriber queues
-_subs: Dict[str, Set[asyncio.Queue]] = {}
+_subs: Dict[str, Set[CommandQueue]] = {}
 _subs_lock = asyncio.Lock()
 
 # optional: track command acks
 _pending: Dict[str, dict] = {}   # command_id -> metadata (optional)
 
+# device_id -> unacked commands restored from a state snapshot, redelivered on the next connect
+_replay: Dict[str, list] = {}
+
+# safety fence: bumped on every safety command; device_id -> fence value of its last safety command.
+# A mission captures fence_token() up front and its later commands are refused once the device was stopped.
+_fence_seq = 0
+_fenced_at: Dict[str, int] = {}
+
+# drop reasons that mean the command was intentionally discarded and must not come back after a restart
+# (an evicted controller's backlog is not replayed on reconnect, so not after a restart either)
+_FINAL_DROPS = {"superseded", "flushed_by_safety", "queue_full", "slow_consumer", "closed"}
+
 def _sse(event: str, data_obj: dict, event_id: Optional[str] = None) -> str:
     # SSE format: optional id, event, data (data must be line-safe)
     data = json.dumps(data_obj, separators=(",", ":"))
@@ -31,42 +46,91 @@ def _sse(event: str, data_obj: dict, event_id: Optional[str] = None) -> str:
 def _sse_comment(line: str) -> str:
     return f": {line}\n\n"
 
-async def enqueue_command(device_id: str, cmd_type: str, payload: dict, command_id: Optional[str] = None):
+def subscriber_counts() -> Dict[str, int]:
+    # called from the loop thread without awaiting, so no lock needed for a read
+    return {k: len(v) for k, v in _subs.items()}
+
+def fence_token() -> int:
+    return _fence_seq
+
+def is_fenced(device_id: str, token: int) -> bool:
+    """True if a safety command was enqueued for device_id after token was taken."""
+    return _fenced_at.get(device_id, 0) > token
+
+async def enqueue_command(
+    device_id: str,
+    cmd_type: str,
+    payload: dict,
+    command_id: Optional[str] = None,
+    trace_id: Optional[str] = None,
+    fence: Optional[int] = None,
+):
     """
     Push a single command to all active SSE subscribers for that device_id.
     Command JSON must match your Android CommandDispatcher.kt schema:
       { "cmd_type": "...", "command_id": "...", "payload": {...} }
+    trace_id (optional) is carried as payload.trace_id for mission tracing.
+    fence (optional, from fence_token()): refuse the command and return None if a
+    safety command reached this device since the token was taken.
     """
+    global _fence_seq
     if command_id is None:
         command_id = str(uuid.uuid4())
 
+    payload = dict(payload or {})
+    if trace_id:
+        payload["trace_id"] = trace_id
+
     cmd = {
         "cmd_type": cmd_type,
         "command_id": command_id,
-        "payload": payload or {}
+        "payload": payload
     }
 
-    # optional: track pending
-    _pending[command_id] = {"device_id": device_id, "cmd": cmd, "ts_ms": int(time.time() * 1000)}
-
     async with _subs_lock:
         qs = list(_subs.get(device_id, set()))
         total = sum(len(v) for v in _subs.values())
 
-    print(f"[SSE] ENQUEUE device_id={device_id} cmd_type={cmd_type} subs_for_device={len(qs)} total_subs={total} command_id={command_id}")
+    # no awaits from here on, so the fence check and the puts below see the same state
+    if fence is not None and is_fenced(device_id, fence):
+        print(f"[SSE] FENCED device_id={device_id} cmd_type={cmd_type} command_id={command_id} (safety command since dispatch started)")
+        feed.publish("drop", {"command_id": command_id, "cmd_type": cmd_type, "reason": "fenced_by_safety"}, device_id=device_id)
+        return None
+
+    safety = is_safety(cmd)
+    if safety:
+        _fence_seq += 1
+        _fenced_at[device_id] = _fence_seq
+
+    tracer.command_enqueued(trace_id, command_id, cmd_type)
+
+    # optional: track pending
+    _pending[command_id] = {"device_id": device_id, "cmd": cmd, "ts_ms": int(time.time() * 1000)}
+
+    lane = "safety" if safety else "normal"
+    print(f"[SSE] ENQUEUE device_id={device_id} cmd_type={cmd_type} lane={lane} subs_for_device={len(qs)} total_subs={total} command_id={command_id}")
+    feed.publish("command", {"command_id": command_id, "cmd_type": cmd_type, "subs": len(qs)}, device_id=device_id)
 
     # if nobody connected, you can decide to drop, or store for later replay
     for q in qs:
-        # avoid blocking if client is slow
-        try:
-            q.put_nowait(cmd)
-        except asyncio.QueueFull:
-            pass
+        # never blocks; the queue applies the drop/coalesce policy for this device/cmd_type
+        for dropped, reason in q.put(cmd):
+            _record_drop(device_id, dropped, reason)
+
+    return command_id
+
+def _record_drop(device_id: str, cmd: dict, reason: str) -> None:
+    command_id = cmd.get("command_id")
+    meta = _pending.get(command_id)
+    if meta is not None:
+        meta["dropped"] = reason
+    print(f"[SSE] DROP device_id={device_id} cmd_type={cmd.get('cmd_type')} command_id={command_id} reason={reason}")
+    feed.publish("drop", {"command_id": command_id, "cmd_type": cmd.get("cmd_type"), "reason": reason}, device_id=device_id)
 
 @router.get("/v1/drone/stream")
 async def drone_stream(request: Request, device_id: str):
     # If you require auth, do it via middleware or check header here.
-    q: asyncio.Queue = asyncio.Queue(maxsize=200)
+    q = CommandQueue(device_id)
 
     async with _subs_lock:
         _subs.setdefault(device_id, set()).add(q)
@@ -74,6 +138,14 @@ async def drone_stream(request: Request, device_id: str):
         per = len(_subs.get(device_id, set()))
 
     print(f"[SSE] CONNECT device_id={device_id} from={request.client.host if request.client else '?'} subs_for_device={per} total_subs={total}")
+    feed.publish("controller", {"status": "connected", "subs": per}, device_id=device_id)
+
+    replay = _replay.pop(device_id, [])
+    for cmd in replay:
+        for dropped, reason in q.put(cmd):
+            _record_drop(device_id, dropped, reason)
+    if replay:
+        print(f"[SSE] REPLAY device_id={device_id} commands={len(replay)}")
 
     async def gen():
         # initial hello (optional)
@@ -87,11 +159,18 @@ async def drone_stream(request: Request, device_id: str):
                 if await request.is_disconnected():
                     break
 
-                try:
-                    # wait for a command, but also send keepalive ping
-                    cmd = await asyncio.wait_for(q.get(), timeout=10.0)
+                # wait for a command, but also send keepalive ping
+                cmd = await q.get(timeout=10.0)
+                if cmd is not None:
+                    yielded_ms = time.time() * 1000
                     yield _sse("command", cmd, event_id=cmd.get("command_id"))
-                except asyncio.TimeoutError:
+                    # resumed once the frame has been written to the transport
+                    tracer.command_delivered(cmd.get("command_id"), yielded_ms, time.time() * 1000)
+                elif q.closed:
+                    # evicted by the disconnect policy; controller reconnects with a fresh queue
+                    print(f"[SSE] EVICT slow consumer device_id={device_id}")
+                    break
+                else:
                     # keepalive (prevents idle timeouts on some networks/proxies)
                     now = time.time()
                     if now - last_ping >= 10.0:
@@ -106,7 +185,13 @@ async def drone_stream(request: Request, device_id: str):
                         _subs.pop(device_id, None)
                 total = sum(len(v) for v in _subs.values())
                 per = len(_subs.get(device_id, set()))
+            # a safety command that reached this queue but never went out is delivered on the next connect
+            unsent = q.take_safety()
+            if unsent:
+                _replay.setdefault(device_id, []).extend(unsent)
+                print(f"[SSE] CARRY safety commands={len(unsent)} device_id={device_id} to next connection")
             print(f"[SSE] DISCONNECT device_id={device_id} subs_for_device={per} total_subs={total}")
+            feed.publish("controller", {"status": "disconnected", "subs": per}, device_id=device_id)
     return StreamingResponse(gen(), media_type="text/event-stream")
 
 @router.post("/v1/drone/ack")
@@ -114,6 +199,7 @@ async def drone_ack(body: dict):
     """
     Android calls this via DroneHttpClient.postAck():
       { device_id, command_id, ok, error }
+    Optional: exec_ms (controller-side execution time) for mission tracing.
     """
     device_id = (body.get("device_id") or "").strip()
     command_id = (body.get("command_id") or "").strip()
@@ -131,10 +217,18 @@ async def drone_ack(body: dict):
 
     removed = _pending.pop(command_id, None)
 
+    exec_ms = body.get("exec_ms")
+    tracer.command_acked(command_id, ok, float(exec_ms) if isinstance(exec_ms, (int, float)) else None)
+
     print(
         f"[ACK] device_id={device_id} command_id={command_id} "
         f"ok={ok} error={error} pending_found={removed is not None}"
     )
+    feed.publish(
+        "ack",
+        {"command_id": command_id, "ok": ok, "error": error, "pending_found": removed is not None},
+        device_id=device_id,
+    )
 
     return {"ok": True, "device_id": device_id, "command_id": command_id, "ack_ok": ok, "error": error}
 
@@ -144,6 +238,8 @@ async def clients():
         return {
             "devices": {k: len(v) for k, v in _subs.items()},
             "total_subs": sum(len(v) for v in _subs.values()),
+            "queue_depth": {k: [q.qsize() for q in v] for k, v in _subs.items()},
+            "drops": {k: dict(v) for k, v in drop_stats.items()},
         }
 
 @router.post("/v1/drone/send")
@@ -160,4 +256,30 @@ async def send_command(request: Request, body: dict):
         raise HTTPException(status_code=400, detail="Missing cmd_type")
 
     final_id = await enqueue_command(device_id=device_id, cmd_type=cmd_type, payload=payload, command_id=command_id)
-    return {"ok": True, "device_id": device_id, "cmd_type": cmd_type, "command_id": final_id}
\ No newline at end of file
+    return {"ok": True, "device_id": device_id, "cmd_type": cmd_type, "command_id": final_id}
+
+# ---- warm restart ----
+
+def export_state(max_age_s: float) -> dict:
+    """Unacked commands worth redelivering, oldest first (includes ones never delivered)."""
+    cutoff = int(time.time() * 1000) - int(max_age_s * 1000)
+    pending = [
+        m for m in _pending.values()
+        if m.get("ts_ms", 0) >= cutoff and m.get("dropped") not in _FINAL_DROPS
+    ]
+    pending.sort(key=lambda m: m.get("ts_ms", 0))
+    return {"pending": pending}
+
+def restore_state(state: dict, max_age_s: float) -> None:
+    cutoff = int(time.time() * 1000) - int(max_age_s * 1000)
+    restored = 0
+    for m in state.get("pending") or []:
+        cmd = m.get("cmd") or {}
+        command_id = cmd.get("command_id")
+        if not command_id or m.get("ts_ms", 0) < cutoff:
+            continue
+        m.pop("dropped", None)
+        _pending[command_id] = m
+        _replay.setdefault(m.get("device_id"), []).append(cmd)
+        restored += 1
+    print(f"[STATE] restored pending commands={restored} devices={sorted(_replay)}")
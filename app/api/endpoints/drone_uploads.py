@@ -1,45 +1,140 @@
 # app/api/endpoints/drone_uploads.py
 import os, time
-from fastapi import APIRouter, UploadFile, File, Request
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Request, HTTPException
+from fastapi.responses import FileResponse
 from app.services.security import enforce_api_key, enforce_lan_only
+from app.services.event_feed import feed
+from app.services.upload_quota import quota, UPLOAD_DIR
+from app.services.media_jobs import media_jobs, preview_path
+from app.services.tracing import tracer
 
 router = APIRouter()
 
-UPLOAD_DIR = os.getenv("DRONE_UPLOAD_DIR", "./uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+DEFAULT_DEVICE_ID = os.getenv("DRONE_DEVICE_ID", "android-controller-01")
+
+async def _save_upload(
+    file: UploadFile,
+    device_id: str,
+    media: str,
+    default_name: str,
+    trace_id: Optional[str] = None,
+    command_id: Optional[str] = None,
+) -> dict:
+    ts = int(time.time() * 1000)
+    safe_name = (file.filename or default_name).replace("/", "_").replace("\\", "_")
+    out_dir = quota.device_dir(device_id)
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"{ts}_{safe_name}")
+    part_path = out_path + ".part"
+
+    # write to .part and reserve quota per chunk; any failure or client abort removes the partial file
+    written = 0
+    try:
+        with open(part_path, "wb") as f:
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                if not quota.reserve(device_id, len(chunk)):
+                    raise HTTPException(status_code=413, detail=f"Upload quota exceeded for device_id={device_id}")
+                written += len(chunk)
+                f.write(chunk)
+        os.replace(part_path, out_path)
+    except BaseException:
+        quota.release(device_id, written)
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        print(f"[UPLOAD] aborted device_id={device_id} media={media} partial_bytes={written}")
+        raise
+
+    feed.publish("upload", {"media": media, "saved_to": out_path, "bytes": written}, device_id=device_id)
+    tracer.upload_stored(trace_id, command_id, media=media, bytes=written)
+
+    # metadata + preview happen off the event loop; the upload response does not wait for them
+    job = media_jobs.submit(out_path, media, device_id)
+    return {"ok": True, "device_id": device_id, "saved_to": out_path, "bytes": written, "media_job": job["status"]}
+
+def _stored_path(device_id: str, name: str) -> str:
+    if not name or name != os.path.basename(name) or name.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    return os.path.join(quota.device_dir(device_id), name)
+
 @router.post("/v1/drone/uploads/photo")
-async def upload_photo(request: Request, file: UploadFile = File(...)):
+async def upload_photo(
+    request: Request,
+    file: UploadFile = File(...),
+    device_id: Optional[str] = None,
+    trace_id: Optional[str] = None,
+    command_id: Optional[str] = None,
+):
     enforce_lan_only(request)
     enforce_api_key(request)
 
     ts = int(time.time() * 1000)
-    safe_name = (file.filename or f"photo_{ts}.jpg").replace("/", "_")
-    out_path = os.path.join(UPLOAD_DIR, f"{ts}_{safe_name}")
-
-    with open(out_path, "wb") as f:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:   
-                break
-            f.write(chunk)
-
-    return {"ok": True, "saved_to": out_path}
+    return await _save_upload(file, device_id or DEFAULT_DEVICE_ID, "photo", f"photo_{ts}.jpg", trace_id, command_id)
 
 @router.post("/v1/drone/uploads/video")
-async def upload_video(request: Request, file: UploadFile = File(...)):
+async def upload_video(
+    request: Request,
+    file: UploadFile = File(...),
+    device_id: Optional[str] = None,
+    trace_id: Optional[str] = None,
+    command_id: Optional[str] = None,
+):
     enforce_lan_only(request)
     enforce_api_key(request)
 
     ts = int(time.time() * 1000)
-    safe_name = (file.filename or f"video_{ts}.mp4").replace("/", "_")
-    out_path = os.path.join(UPLOAD_DIR, f"{ts}_{safe_name}")
+    return await _save_upload(file, device_id or DEFAULT_DEVICE_ID, "video", f"video_{ts}.mp4", trace_id, command_id)
+
+@router.get("/v1/drone/uploads/quota")
+async def upload_quota(request: Request, device_id: Optional[str] = None):
+    enforce_lan_only(request)
+    enforce_api_key(request)
 
-    with open(out_path, "wb") as f:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            f.write(chunk)
+    device_id = device_id or DEFAULT_DEVICE_ID
+    return {
+        "ok": True,
+        "device_id": device_id,
+        "used_bytes": quota.used(device_id),
+        "quota_bytes": quota.quota_bytes,
+        "remaining_bytes": quota.remaining(device_id),
+    }
+
+@router.get("/v1/drone/uploads/media")
+async def list_media(request: Request, device_id: Optional[str] = None, limit: int = 50):
+    enforce_lan_only(request)
+    enforce_api_key(request)
+
+    items = [r for r in reversed(media_jobs.results.values()) if not device_id or r["device_id"] == device_id]
+    return {
+        "ok": True,
+        "queue_depth": media_jobs.depth(),
+        "stats": media_jobs.stats,
+        "items": items[: max(1, min(limit, 500))],
+    }
+
+@router.get("/v1/drone/uploads/media/{device_id}/{name}")
+async def media_info(request: Request, device_id: str, name: str):
+    enforce_lan_only(request)
+    enforce_api_key(request)
+
+    rec = media_jobs.lookup(_stored_path(device_id, name))
+    if rec is None:
+        raise HTTPException(status_code=404, detail="No media record")
+    return {"ok": True, **rec}
+
+@router.get("/v1/drone/uploads/preview/{device_id}/{name}")
+async def media_preview(request: Request, device_id: str, name: str):
+    enforce_lan_only(request)
+    enforce_api_key(request)
 
-    return {"ok": True, "saved_to": out_path}
+    p = preview_path(_stored_path(device_id, name))
+    if not os.path.isfile(p):
+        raise HTTPException(status_code=404, detail="Preview not ready")
+    return FileResponse(p, media_type="image/jpeg")
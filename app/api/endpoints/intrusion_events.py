@@ -0,0 +1,38 @@
+# app/api/endpoints/intrusion_events.py
+import asyncio
+import time
+from typing import Optional
+from fastapi import APIRouter, Request, HTTPException
+
+from app.services.security import enforce_api_key, enforce_lan_only
+from app.services.event_store import store
+
+router = APIRouter()
+
+MAX_QUERY_LIMIT = 5000
+
+@router.get("/v1/intrusion/events")
+async def query_intrusion_events(
+    request: Request,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    device_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = 500,
+):
+    """
+    Stored intrusion events, oldest first. The range is on server receive time
+    (stored_at_ms); defaults to the last 24h.
+    """
+    enforce_lan_only(request)
+    enforce_api_key(request)
+
+    now = int(time.time() * 1000)
+    end_ms = end_ms if end_ms is not None else now
+    start_ms = start_ms if start_ms is not None else end_ms - 24 * 3600 * 1000
+    if start_ms > end_ms:
+        raise HTTPException(status_code=400, detail="start_ms must be <= end_ms")
+    limit = max(1, min(limit, MAX_QUERY_LIMIT))
+
+    result = await asyncio.to_thread(store.query, start_ms, end_ms, device_id, event_type, limit)
+    return {"ok": True, "start_ms": start_ms, "end_ms": end_ms, **result}
@@ -0,0 +1,22 @@
+# app/api/endpoints/mission_templates.py
+from fastapi import APIRouter, Request
+
+from app.services.security import enforce_api_key, enforce_lan_only
+from app.services.mission_templates import mission_templates
+
+router = APIRouter()
+
+@router.get("/v1/missions/templates")
+async def templates_status(request: Request):
+    """Which template each camera/event_type resolves to, plus the last reload result."""
+    enforce_lan_only(request)
+    enforce_api_key(request)
+    return {"ok": True, **mission_templates.status()}
+
+@router.post("/v1/missions/templates/reload")
+async def templates_reload(request: Request):
+    """Force a reload check now instead of waiting for the next poll."""
+    enforce_lan_only(request)
+    enforce_api_key(request)
+    changed = await mission_templates.reload_if_changed()
+    return {"ok": mission_templates.last_error is None, "changed": changed, **mission_templates.status()}
@@ -0,0 +1,95 @@
+# app/api/endpoints/operator_feed.py
+import json
+import time
+from typing import Optional
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from app.services.security import enforce_api_key, enforce_lan_only
+from app.services.event_feed import feed
+from app.api.endpoints import drone_sse, drone_livestream
+
+router = APIRouter()
+
+SNAPSHOT_MAX_PENDING = 50
+
+def _csv(v: Optional[str]) -> Optional[set]:
+    if not v:
+        return None
+    out = {p.strip() for p in v.split(",") if p.strip()}
+    return out or None
+
+def _snapshot(devices: Optional[set]) -> dict:
+    # built synchronously (no awaits) so it is consistent with feed.seq at the same instant
+    def want(d: Optional[str]) -> bool:
+        return devices is None or d in devices
+
+    pending = [
+        {"command_id": cid, "device_id": m.get("device_id"), "cmd_type": m["cmd"].get("cmd_type"), "ts_ms": m.get("ts_ms"), "dropped": m.get("dropped")}
+        for cid, m in drone_sse._pending.items()
+        if want(m.get("device_id"))
+    ]
+    return {
+        "seq": feed.seq,
+        "ts_ms": int(time.time() * 1000),
+        "controllers": {k: v for k, v in drone_sse.subscriber_counts().items() if want(k)},
+        "livestreams": {k: v for k, v in drone_livestream._live.items() if want(k)},
+        "pending_total": len(pending),
+        "pending": pending[-SNAPSHOT_MAX_PENDING:],
+    }
+
+def _frame(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+@router.get("/v1/operator/stream")
+async def operator_stream(
+    request: Request,
+    kinds: Optional[str] = None,
+    device_id: Optional[str] = None,
+    api_key: Optional[str] = None,
+):
+    """
+    Operator dashboard feed: one "snapshot" event with current state, then deltas only.
+      kinds:     comma list of intrusion,command,drop,ack,upload,media,controller,livestream
+      device_id: comma list of controller/camera ids
+      api_key:   for browser EventSource, which cannot set x-api-key
+    """
+    enforce_lan_only(request)
+    enforce_api_key(api_key if api_key else request)
+
+    want_kinds = _csv(kinds)
+    want_devices = _csv(device_id)
+
+    print(f"[FEED] CONNECT from={request.client.host if request.client else '?'} kinds={want_kinds} devices={want_devices}")
+
+    async def gen():
+        cursor = feed.seq
+        yield _frame("snapshot", _snapshot(want_devices))
+
+        try:
+            while True:
+                if await request.is_disconnected():
+                    break
+
+                if not await feed.wait(cursor, timeout=10.0):
+                    yield _frame("ping", {"ts_ms": int(time.time() * 1000)})
+                    continue
+
+                items, gap = feed.since(cursor)
+                if gap:
+                    # fell behind the ring buffer: resync instead of replaying
+                    cursor = feed.seq
+                    yield _frame("snapshot", _snapshot(want_devices))
+                    continue
+
+                for seq, kind, dev, frame in items:
+                    cursor = seq
+                    if want_kinds is not None and kind not in want_kinds:
+                        continue
+                    if want_devices is not None and dev not in want_devices:
+                        continue
+                    yield frame
+        finally:
+            print("[FEED] DISCONNECT")
+
+    return StreamingResponse(gen(), media_type="text/event-stream")
@@ -0,0 +1,30 @@
+# app/api/endpoints/traces.py
+from fastapi import APIRouter, Request, HTTPException
+
+from app.services.security import enforce_api_key, enforce_lan_only
+from app.services.tracing import tracer
+
+router = APIRouter()
+
+@router.get("/v1/traces")
+async def list_traces(request: Request, limit: int = 50):
+    """Aggregate per-stage percentiles plus the most recent mission traces."""
+    enforce_lan_only(request)
+    enforce_api_key(request)
+
+    return {
+        "ok": True,
+        "stages": tracer.percentiles(),
+        "recent": tracer.recent(max(1, min(limit, 500))),
+    }
+
+@router.get("/v1/traces/{trace_id}")
+async def get_trace(request: Request, trace_id: str):
+    """Waterfall for one mission (trace_id is the incident_id)."""
+    enforce_lan_only(request)
+    enforce_api_key(request)
+
+    w = tracer.waterfall(trace_id)
+    if w is None:
+        raise HTTPException(status_code=404, detail="Unknown trace_id")
+    return {"ok": True, **w}
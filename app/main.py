@@ -1,8 +1,9 @@
 import os
+import asyncio
 import time
+import uuid
 from typing import Optional
-import httpx
-from fastapi import FastAPI, BackgroundTasks, Request
+from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 
@@ -15,27 +16,66 @@ from app.api.endpoints.drone import router as drone_router
 from app.api.endpoints.drone_sse import router as drone_sse_router, enqueue_command
 from app.api.endpoints.drone_uploads import router as drone_uploads_router
 from app.api.endpoints.drone_livestream import router as drone_livestream_router
+from app.api.endpoints.operator_feed import router as operator_feed_router
+from app.api.endpoints.intrusion_events import router as intrusion_events_router
+from app.api.endpoints.traces import router as traces_router
+from app.api.endpoints.mission_templates import router as mission_templates_router
+from app.services.event_feed import feed
+from app.services.event_store import store as event_store
+from app.services.correlation import correlator, Incident, CORRELATION_SETTLE_MS
+from app.services.body_limit import BodySizeLimitMiddleware
+from app.services.admission import admission, LoadSheddingMiddleware
+from app.services.upload_quota import cleanup_partials
+from app.services.media_jobs import media_jobs
+from app.services.task_tracker import dispatch_tasks
+from app.services.tracing import tracer
+from app.services.mission_templates import mission_templates
+from app.services import rate_limit, state_snapshot
+from app.api.endpoints import drone_sse, drone_livestream
 from app.services.dji_controller_client import DJIControllerClient
 
 load_dotenv()
 
-MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", "8192"))
 DRONE_DEVICE_ID = os.getenv("DRONE_DEVICE_ID", "android-controller-01")
 SERVER_PUBLIC_BASE = os.getenv("SERVER_PUBLIC_BASE", "http://192.168.1.49:8080") 
 
 app = FastAPI()
+# per-route request size limits (MAX_BODY_BYTES for JSON, larger for uploads), enforced while the body streams
+app.add_middleware(BodySizeLimitMiddleware)
+
 @app.on_event("startup")
 async def _startup():
     print("[BOOT] intruder-server starting up")
     print(f"[BOOT] DRONE_DEVICE_ID={DRONE_DEVICE_ID}")
     print(f"[BOOT] SERVER_PUBLIC_BASE={SERVER_PUBLIC_BASE}")
 
-    # show which SSE devices are currently connected (will be empty at boot)
+    removed = cleanup_partials()
+    if removed:
+        print(f"[BOOT] removed {removed} partial upload(s)")
+
+    # warm restart: unacked commands, livestream state and limiter windows from the last graceful shutdown
+    try:
+        sections = state_snapshot.load()
+        if sections:
+            drone_sse.restore_state(sections.get("sse") or {}, state_snapshot.STATE_REPLAY_MAX_AGE_S)
+            drone_livestream.restore_state(sections.get("livestream") or {})
+            rate_limit.restore_state(sections.get("rate_limit") or {})
+    except Exception as e:
+        print(f"[BOOT] state restore failed: {type(e).__name__}: {e}")
+
+    event_store.open()
+    event_store.start()
+    media_jobs.start()
+    admission.start()
     try:
-        from .api.endpoints import drone_sse
-        print("[BOOT] SSE router mounted: /v1/drone/stream, /v1/drone/clients, /v1/drone/ack")
+        await mission_templates.reload_if_changed()
     except Exception as e:
-        print(f"[BOOT] SSE import check failed: {type(e).__name__}: {e}")
+        # a broken config must not keep the server down; the builtin templates stay in place
+        mission_templates.last_error = f"{type(e).__name__}: {e}"
+        print(f"[BOOT] mission templates load failed, using builtin: {mission_templates.last_error}")
+    mission_templates.start()
+
+    print("[BOOT] SSE router mounted: /v1/drone/stream, /v1/drone/clients, /v1/drone/ack")
 
     # Optional: print all registered routes (helps confirm routers are included)
     try:
@@ -71,84 +111,137 @@ async def log_all_requests(request: Request, call_next):
     print(f"[RES] {request.method} {path} -> {response.status_code} ({ms}ms)")
     return response
 
-DRONE_COMMAND_URL = os.getenv("DRONE_COMMAND_URL", "http://127.0.0.1:9090/commands")
-
-def build_scripted_flight_path(event: dict) -> dict:
-    # Replace this later with your real flight path generator
-    return {
-        "mission_id": f"intrusion-{int(time.time())}",
-        "source_event": event,
-        "commands": [
-            {"type": "yaw", "deg": 30, "duration_ms": 500},
-            {"type": "forward", "mps": 0.4, "duration_ms": 2000},
-            {"type": "hover", "duration_ms": 1000},
-        ],
-    }
-
-async def post_commands(cmd_payload: dict) -> None:
-    async with httpx.AsyncClient(timeout=5) as client:
-        r = await client.post(DRONE_COMMAND_URL, json=cmd_payload)
-        # Helpful debug
-        print(f"[CMD] POST -> {DRONE_COMMAND_URL} status={r.status_code}")
+# added last so it wraps everything above, request logging included:
+# under overload, low-priority endpoints get a 503 before any other work
+app.add_middleware(LoadSheddingMiddleware)
 
 # NEW: include router
 app.include_router(drone_router)
 app.include_router(drone_sse_router)
 app.include_router(drone_uploads_router)
 app.include_router(drone_livestream_router)
+app.include_router(operator_feed_router)
+app.include_router(intrusion_events_router)
+app.include_router(traces_router)
+app.include_router(mission_templates_router)
 
 # NEW: clean shutdown for httpx client
 @app.on_event("shutdown")
 async def _shutdown():
+    # uvicorn has already closed the SSE streams by now; let missions still being dispatched finish
+    # enqueueing so their commands land in _pending and are snapshotted (undelivered ones replay on reconnect)
+    await dispatch_tasks.drain(state_snapshot.STATE_SHUTDOWN_DEADLINE_S)
+
+    try:
+        state_snapshot.save({
+            "sse": drone_sse.export_state(state_snapshot.STATE_REPLAY_MAX_AGE_S),
+            "livestream": drone_livestream.export_state(),
+            "rate_limit": rate_limit.export_state(),
+        })
+    except Exception as e:
+        print(f"[SHUTDOWN] state snapshot failed: {type(e).__name__}: {e}")
+
+    await mission_templates.stop()
+    await admission.stop()
+    await media_jobs.stop()
+    await event_store.close()
     await DJIControllerClient.aclose_singleton()
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {"ok": True, "admission": admission.status()}
 
 @app.post("/v1/intrusion/events")
-async def intrusion_events(event: IntrusionEvent, request: Request, background: BackgroundTasks):
+async def intrusion_events(event: IntrusionEvent, request: Request):
+    intake_start_ms = time.time() * 1000
     enforce_lan_only(request)
     enforce_api_key(request)
 
     payload = event.model_dump()
+
+    # under overload only high-confidence detections may start a new incident (and a mission);
+    # the camera retries the rest. Events joining an existing incident cost no dispatch and always get in.
+    if correlator.peek(payload) is None:
+        admission.admit_intrusion(event.score, event.device_id)
+
     print("INTRUSION EVENT:", payload)
+    incident, is_new = correlator.observe(payload)
+    feed.publish("intrusion", {**payload, "incident_id": incident.incident_id}, device_id=event.device_id)
 
-    # OPTIONAL: keep your old cmd print for logging only
-    cmd = build_scripted_flight_path(payload)
-    print("[CMD] dispatching:", cmd)
+    try:
+        event_store.append({**payload, "incident_id": incident.incident_id})
+    except Exception as e:
+        # losing the record must not block the mission
+        print(f"[STORE] append failed {type(e).__name__}: {e}")
 
     # NEW: send mission over SSE to the DJI controller device
-    background.add_task(dispatch_intrusion_mission, payload)
-    print("[SSE] queued dispatch_intrusion_mission")
-
-    return {"ok": True, "received_at_ms": int(time.time() * 1000)}
-
-
-async def dispatch_intrusion_mission(source_event: dict) -> None:
-    # 1) enable VS
-    await enqueue_command(
-        device_id=DRONE_DEVICE_ID,
-        cmd_type="VS_ENABLE",
-        payload={"enabled": True, "reason": "intrusion", "source_event": source_event},
-    )
-
-    # 2) move sequence
-    moves = [
-        {"leftX": 0, "leftY": 0, "rightX": 0, "rightY": 0.25, "durationMs": 800, "hz": 25},
-        {"leftX": 0, "leftY": 0, "rightX": 0, "rightY": -0.25, "durationMs": 800, "hz": 25},
-        {"leftX": 0, "leftY": 0, "rightX": 0.25, "rightY": 0, "durationMs": 800, "hz": 25},
-        {"leftX": 0, "leftY": 0, "rightX": -0.25, "durationMs": 800, "hz": 25},
-    ]
-    await enqueue_command(
-        device_id=DRONE_DEVICE_ID,
-        cmd_type="MOVE_SEQUENCE",
-        payload={"moves": moves, "defaultHz": 25},
-    )
-
-    # 3) snapshot (controller uploads back to server)
-    await enqueue_command(
-        device_id=DRONE_DEVICE_ID,
-        cmd_type="SNAPSHOT",
-        payload={"upload_url": f"{SERVER_PUBLIC_BASE}/v1/drone/uploads/photo"},
-    )
\ No newline at end of file
+    # only the first event of an incident dispatches; neighbouring cameras just join it
+    if is_new:
+        # one trace per incident, keyed by incident_id, from intake to the SNAPSHOT upload
+        tracer.start(incident.incident_id, started_ms=intake_start_ms, camera=event.device_id, event_type=event.event_type, event_id=event.event_id)
+        tracer.span(incident.incident_id, "intake", intake_start_ms, time.time() * 1000)
+        # tracked (not BackgroundTasks) so shutdown can drain it before snapshotting state
+        # fence taken at intake: a safety command during the settle window or between steps cancels the rest
+        dispatch_tasks.spawn(dispatch_incident(incident, drone_sse.fence_token()))
+        print(f"[SSE] queued dispatch_incident incident_id={incident.incident_id}")
+    else:
+        print(f"[CORR] joined incident_id={incident.incident_id} cameras={sorted(incident.camera_scores)} score={incident.score} dispatched={incident.dispatched}")
+
+    return {
+        "ok": True,
+        "incident_id": incident.incident_id,
+        "new_incident": is_new,
+        "received_at_ms": int(time.time() * 1000),
+    }
+
+
+async def dispatch_incident(incident: Incident, fence: int) -> None:
+    # short settle so overlapping cameras land in the incident before the mission goes out
+    settle_start_ms = time.time() * 1000
+    if CORRELATION_SETTLE_MS > 0:
+        await asyncio.sleep(CORRELATION_SETTLE_MS / 1000)
+    tracer.span(incident.incident_id, "settle", settle_start_ms, time.time() * 1000)
+    incident.dispatched = True
+    summary = incident.summary()
+    print(f"[CORR] dispatching incident {summary}")
+    await dispatch_intrusion_mission(incident.first_event, incident=summary, trace_id=incident.incident_id, fence=fence)
+
+
+async def dispatch_intrusion_mission(
+    source_event: dict,
+    incident: Optional[dict] = None,
+    trace_id: Optional[str] = None,
+    fence: Optional[int] = None,
+) -> None:
+    # precompiled per-camera template; only per-dispatch fields are added to the (copied) payloads
+    tpl = mission_templates.lookup(source_event.get("device_id"), source_event.get("event_type"))
+    device_id = tpl.device_id or DRONE_DEVICE_ID
+    print(f"[MISSION] template={tpl.name} camera={source_event.get('device_id')} device_id={device_id} steps={len(tpl.steps)}")
+
+    for cmd_type, static_payload in tpl.steps:
+        payload = dict(static_payload)
+        command_id = None
+
+        if cmd_type == "VS_ENABLE":
+            payload["source_event"] = source_event
+            payload["incident"] = incident
+
+        if cmd_type == "SNAPSHOT" and not payload.get("upload_url"):
+            # controller uploads back to server; URL carries trace_id/command_id so the photo closes the mission trace
+            command_id = str(uuid.uuid4())
+            upload_url = f"{SERVER_PUBLIC_BASE}/v1/drone/uploads/photo?device_id={device_id}&command_id={command_id}"
+            if trace_id:
+                upload_url += f"&trace_id={trace_id}"
+            payload["upload_url"] = upload_url
+
+        sent = await enqueue_command(
+            device_id=device_id,
+            cmd_type=cmd_type,
+            payload=payload,
+            command_id=command_id,
+            trace_id=trace_id,
+            fence=fence,
+        )
+        if sent is None:
+            print(f"[MISSION] aborted template={tpl.name} device_id={device_id} at step={cmd_type}: safety command received")
+            return
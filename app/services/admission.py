@@ -0,0 +1,133 @@
+# app/services/admission.py
+import asyncio
+import json
+import os
+from typing import Optional
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+from app.services.task_tracker import dispatch_tasks
+
+load_dotenv()
+
+ADMISSION_LAG_SHED_MS = float(os.getenv("ADMISSION_LAG_SHED_MS", "150"))
+ADMISSION_MAX_INFLIGHT_DISPATCH = int(os.getenv("ADMISSION_MAX_INFLIGHT_DISPATCH", "20"))
+ADMISSION_HIGH_SCORE = float(os.getenv("ADMISSION_HIGH_SCORE", "0.8"))
+ADMISSION_RETRY_AFTER_S = int(os.getenv("ADMISSION_RETRY_AFTER_S", "2"))
+ADMISSION_PROBE_INTERVAL_MS = float(os.getenv("ADMISSION_PROBE_INTERVAL_MS", "100"))
+
+# shed first under overload: dashboards and history, never control/ack/stream/uploads
+LOW_PRIORITY_PREFIXES = (
+    "/v1/drone/clients",
+    "/v1/drone/ping",
+    "/v1/drone/livestream/status",
+    "/v1/drone/uploads/media",
+    "/v1/drone/uploads/preview",
+    "/v1/drone/uploads/quota",
+    "/v1/operator/stream",
+    "/v1/traces",
+)
+
+def _is_low_priority(scope) -> bool:
+    path = scope.get("path", "")
+    if path.startswith(LOW_PRIORITY_PREFIXES):
+        return True
+    # history queries share a path with intake; only the GET is sheddable here
+    return path == "/v1/intrusion/events" and scope.get("method") == "GET"
+
+
+class AdmissionController:
+    """
+    Process-wide overload detection for intrusion intake and low-priority endpoints.
+
+    Overload = event-loop lag (EWMA of how late a periodic sleep wakes up) above
+    ADMISSION_LAG_SHED_MS, or more than ADMISSION_MAX_INFLIGHT_DISPATCH mission
+    dispatch tasks in flight. While overloaded, intrusion events scoring below
+    ADMISSION_HIGH_SCORE get 429 and low-priority endpoints get 503, both with
+    Retry-After. High-confidence detections are always admitted.
+    """
+
+    def __init__(self) -> None:
+        self.lag_ms = 0.0
+        self.stats = {"shed_intrusions": 0, "shed_requests": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._probe())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval = ADMISSION_PROBE_INTERVAL_MS / 1000
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, (loop.time() - t0 - interval) * 1000)
+            # rise fast, decay slowly, so one stall trips shedding but recovery needs a few clean probes
+            self.lag_ms = lag if lag > self.lag_ms else 0.7 * self.lag_ms + 0.3 * lag
+
+    def overload_reason(self) -> Optional[str]:
+        if self.lag_ms > ADMISSION_LAG_SHED_MS:
+            return "loop_lag"
+        if dispatch_tasks.inflight() >= ADMISSION_MAX_INFLIGHT_DISPATCH:
+            return "dispatch_backlog"
+        return None
+
+    def admit_intrusion(self, score: float, device_id: str) -> None:
+        """Raise 429 for a low-score event while overloaded."""
+        reason = self.overload_reason()
+        if reason is None or score >= ADMISSION_HIGH_SCORE:
+            return
+        self.stats["shed_intrusions"] += 1
+        print(f"[ADMIT] shed intrusion device_id={device_id} score={score} reason={reason} lag_ms={self.lag_ms:.0f}")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Overloaded ({reason}); retry later",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER_S)},
+        )
+
+    def status(self) -> dict:
+        return {
+            "overloaded": self.overload_reason(),
+            "lag_ms": round(self.lag_ms, 1),
+            "inflight_dispatch": dispatch_tasks.inflight(),
+            **self.stats,
+        }
+
+
+admission = AdmissionController()
+
+
+class LoadSheddingMiddleware:
+    """ASGI guard returning a fast 503 for low-priority endpoints while the process is overloaded."""
+
+    def __init__(self, app, controller: AdmissionController = admission) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and _is_low_priority(scope):
+            reason = self.controller.overload_reason()
+            if reason:
+                self.controller.stats["shed_requests"] += 1
+                body = json.dumps({"detail": f"Overloaded ({reason}); retry later"}).encode()
+                await send({
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"retry-after", str(ADMISSION_RETRY_AFTER_S).encode()),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
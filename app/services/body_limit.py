@@ -0,0 +1,114 @@
+# app/services/body_limit.py
+import json
+import os
+from typing import Optional
+from urllib.parse import parse_qs
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+from app.services.upload_quota import quota
+
+load_dotenv()
+
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", "8192"))
+UPLOAD_PHOTO_MAX_BYTES = int(os.getenv("UPLOAD_PHOTO_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_VIDEO_MAX_BYTES = int(os.getenv("UPLOAD_VIDEO_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+DEFAULT_DEVICE_ID = os.getenv("DRONE_DEVICE_ID", "android-controller-01")
+
+# multipart boundaries/headers on top of the file itself
+MULTIPART_SLACK_BYTES = 64 * 1024
+
+ROUTE_BODY_LIMITS = {
+    "/v1/drone/uploads/photo": UPLOAD_PHOTO_MAX_BYTES,
+    "/v1/drone/uploads/video": UPLOAD_VIDEO_MAX_BYTES,
+}
+
+
+class BodyTooLarge(HTTPException):
+    # an HTTPException so FastAPI's body parsing re-raises it instead of turning it into a 400
+    def __init__(self, limit: int) -> None:
+        super().__init__(status_code=413, detail=f"Request body too large (limit={limit} bytes)")
+
+
+def route_body_limit(scope) -> Optional[int]:
+    path = scope.get("path", "")
+    limit = ROUTE_BODY_LIMITS.get(path)
+    if limit is None:
+        return MAX_BODY_BYTES
+
+    # uploads: also cap by what is left of the device's disk quota
+    qs = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    device_id = (qs.get("device_id") or [DEFAULT_DEVICE_ID])[0]
+    return min(limit, quota.remaining(device_id) + MULTIPART_SLACK_BYTES)
+
+
+class BodySizeLimitMiddleware:
+    """
+    Pure ASGI guard that counts request body bytes as they stream in and fails
+    the request with 413 as soon as the per-route limit is crossed, before the
+    body is buffered or parsed. A Content-Length over the limit is rejected
+    without reading anything.
+    """
+
+    def __init__(self, app, limit_for=route_body_limit) -> None:
+        self.app = app
+        self.limit_for = limit_for
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limit_for(scope)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for k, v in scope.get("headers") or []:
+            if k == b"content-length":
+                try:
+                    declared = int(v)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    print(f"[LIMIT] reject {scope.get('path')} content-length={declared} limit={limit}")
+                    await self._send_413(send, limit)
+                    return
+                break
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    print(f"[LIMIT] abort {scope.get('path')} received>{limit}")
+                    raise BodyTooLarge(limit)
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except BodyTooLarge:
+            # raised outside FastAPI's own handling (e.g. a raw request.stream() reader)
+            if started:
+                raise
+            await self._send_413(send, limit)
+
+    @staticmethod
+    async def _send_413(send, limit: int) -> None:
+        body = json.dumps({"detail": f"Request body too large (limit={limit} bytes)"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
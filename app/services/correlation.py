@@ -0,0 +1,128 @@
+# app/services/correlation.py
+import os
+import time
+import uuid
+from typing import Dict, Optional, Set
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CORRELATION_WINDOW_MS = int(os.getenv("CORRELATION_WINDOW_MS", "5000"))
+# how long a new incident waits for neighbouring cameras before its mission is sent
+CORRELATION_SETTLE_MS = int(os.getenv("CORRELATION_SETTLE_MS", "300"))
+# an incident that keeps getting events is split after this long so a lingering person re-triggers
+CORRELATION_MAX_INCIDENT_MS = int(os.getenv("CORRELATION_MAX_INCIDENT_MS", "60000"))
+
+def _parse_neighbors(raw: str) -> Dict[str, Set[str]]:
+    # "cam-a=cam-b|cam-c,cam-b=cam-d"  (symmetric)
+    out: Dict[str, Set[str]] = {}
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        cam, rest = (x.strip() for x in part.split("=", 1))
+        for other in (x.strip() for x in rest.split("|")):
+            if cam and other and other != cam:
+                out.setdefault(cam, set()).add(other)
+                out.setdefault(other, set()).add(cam)
+    return out
+
+CAMERA_NEIGHBORS = _parse_neighbors(os.getenv("CAMERA_NEIGHBORS", ""))
+
+
+class Incident:
+    def __init__(self, first_event: dict, now_ms: int) -> None:
+        self.incident_id = f"inc-{uuid.uuid4().hex[:12]}"
+        self.first_event = first_event
+        self.first_ms = now_ms
+        self.last_ms = now_ms
+        self.event_ids: list = []
+        self.camera_scores: Dict[str, float] = {}
+        self.dispatched = False  # set once the settle window ends; later joiners are not in the mission's incident summary
+        self.add(first_event, now_ms)
+
+    def add(self, event: dict, now_ms: int) -> None:
+        cam = event.get("device_id") or "?"
+        self.camera_scores[cam] = max(self.camera_scores.get(cam, 0.0), float(event.get("score") or 0.0))
+        self.event_ids.append(event.get("event_id"))
+        self.last_ms = now_ms
+
+    @property
+    def score(self) -> float:
+        # noisy-OR over cameras: independent sightings raise confidence,
+        # repeated frames from one camera do not
+        miss = 1.0
+        for s in self.camera_scores.values():
+            miss *= 1.0 - s
+        return round(1.0 - miss, 4)
+
+    def summary(self) -> dict:
+        return {
+            "incident_id": self.incident_id,
+            "cameras": sorted(self.camera_scores),
+            "event_ids": [e for e in self.event_ids if e],
+            "event_count": len(self.event_ids),
+            "score": self.score,
+            "first_ms": self.first_ms,
+            "last_ms": self.last_ms,
+            "dispatched": self.dispatched,
+        }
+
+
+class Correlator:
+    """
+    Groups intrusion events from the same or neighbouring cameras (CAMERA_NEIGHBORS)
+    that arrive within CORRELATION_WINDOW_MS into one incident.
+
+    Lookup is an in-memory index (camera, time bucket) -> incident, where a bucket is
+    one window wide; an event only checks its own and neighbouring cameras in the
+    current and previous bucket.
+    """
+
+    def __init__(self, neighbors: Dict[str, Set[str]] = CAMERA_NEIGHBORS, window_ms: int = CORRELATION_WINDOW_MS) -> None:
+        self.neighbors = neighbors
+        self.window_ms = max(1, window_ms)
+        self._index: Dict[tuple, Incident] = {}
+        self._last_bucket: Optional[int] = None
+
+    def _prune(self, bucket: int) -> None:
+        if bucket == self._last_bucket:
+            return
+        self._last_bucket = bucket
+        self._index = {k: v for k, v in self._index.items() if k[1] >= bucket - 1}
+
+    def _match(self, cam: str, bucket: int, now_ms: int) -> Optional[Incident]:
+        best: Optional[Incident] = None
+        for c in {cam} | self.neighbors.get(cam, set()):
+            for b in (bucket, bucket - 1):
+                inc = self._index.get((c, b))
+                if inc is None or now_ms - inc.last_ms > self.window_ms:
+                    continue
+                if now_ms - inc.first_ms > CORRELATION_MAX_INCIDENT_MS:
+                    continue
+                if best is None or inc.last_ms > best.last_ms:
+                    best = inc
+        return best
+
+    def peek(self, event: dict, now_ms: Optional[int] = None) -> Optional[Incident]:
+        """The incident this event would join, without recording it; None means it would start a new one."""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        return self._match(event.get("device_id") or "?", now_ms // self.window_ms, now_ms)
+
+    def observe(self, event: dict, now_ms: Optional[int] = None) -> tuple[Incident, bool]:
+        """Returns (incident, is_new). Only a new incident should dispatch a mission."""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        bucket = now_ms // self.window_ms
+        self._prune(bucket)
+
+        cam = event.get("device_id") or "?"
+        best = self._match(cam, bucket, now_ms)
+        is_new = best is None
+        if best is None:
+            best = Incident(event, now_ms)
+        else:
+            best.add(event, now_ms)
+        self._index[(cam, bucket)] = best
+        return best, is_new
+
+
+correlator = Correlator()
@@ -0,0 +1,78 @@
+# app/services/event_feed.py
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OPERATOR_FEED_BUFFER = int(os.getenv("OPERATOR_FEED_BUFFER", "2048"))
+
+
+class OperatorFeed:
+    """
+    Shared fan-out for the operator dashboard stream.
+
+    Each delta is serialised to an SSE frame exactly once and appended to a ring
+    buffer. Subscribers only hold a cursor (last seq they sent) and wake on one
+    shared asyncio.Event, so N dashboards cost roughly the same as one.
+    """
+
+    def __init__(self, maxlen: int = OPERATOR_FEED_BUFFER) -> None:
+        self._buf: deque = deque(maxlen=maxlen)  # (seq, kind, device_id, frame)
+        self._seq = 0
+        self._wake = asyncio.Event()
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def publish(self, kind: str, data: dict, device_id: Optional[str] = None) -> int:
+        self._seq += 1
+        body = {
+            "seq": self._seq,
+            "kind": kind,
+            "device_id": device_id,
+            "ts_ms": int(time.time() * 1000),
+            "data": data,
+        }
+        frame = f"id: {self._seq}\nevent: {kind}\ndata: {json.dumps(body, separators=(',', ':'), default=str)}\n\n"
+        self._buf.append((self._seq, kind, device_id, frame))
+
+        # wake everyone waiting on the current generation, then start a new one
+        self._wake.set()
+        self._wake = asyncio.Event()
+        return self._seq
+
+    def since(self, cursor: int) -> tuple[list, bool]:
+        """
+        Returns (items newer than cursor, gap). gap=True means the subscriber fell
+        further behind than the ring buffer holds and should resync from a snapshot.
+        """
+        n = self._seq - cursor
+        if n <= 0:
+            return [], False
+        if n > len(self._buf):
+            return [], True
+        out = []
+        for item in reversed(self._buf):
+            if len(out) >= n:
+                break
+            out.append(item)
+        out.reverse()
+        return out, False
+
+    async def wait(self, cursor: int, timeout: float) -> bool:
+        if self._seq > cursor:
+            return True
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+feed = OperatorFeed()
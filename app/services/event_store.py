@@ -0,0 +1,295 @@
+# app/services/event_store.py
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EVENT_STORE_DIR = os.getenv("EVENT_STORE_DIR", "./data/events")
+EVENT_SEGMENT_MAX_BYTES = int(os.getenv("EVENT_SEGMENT_MAX_BYTES", str(8 * 1024 * 1024)))
+EVENT_SEGMENT_MAX_AGE_S = int(os.getenv("EVENT_SEGMENT_MAX_AGE_S", "3600"))
+EVENT_INDEX_EVERY = int(os.getenv("EVENT_INDEX_EVERY", "64"))
+EVENT_FSYNC_INTERVAL_MS = int(os.getenv("EVENT_FSYNC_INTERVAL_MS", "250"))
+EVENT_FSYNC_BATCH = int(os.getenv("EVENT_FSYNC_BATCH", "64"))
+EVENT_RETENTION_DAYS = float(os.getenv("EVENT_RETENTION_DAYS", "30"))
+
+
+class _Segment:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.first_ts: Optional[int] = None
+        self.last_ts: Optional[int] = None
+        self.size = 0
+        self.count = 0
+        self.index: list[tuple[int, int]] = []  # sparse (stored_at_ms, byte offset), every EVENT_INDEX_EVERY records
+
+    @property
+    def idx_path(self) -> str:
+        return self.path[: -len(".jsonl")] + ".idx"
+
+    def note(self, ts: int, offset: int, nbytes: int) -> None:
+        if self.count % EVENT_INDEX_EVERY == 0:
+            self.index.append((ts, offset))
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        self.size = offset + nbytes
+        self.count += 1
+
+    def start_offset(self, start_ms: int) -> int:
+        # last index entry strictly before start_ms; everything ahead of it is older
+        pos = bisect.bisect_left([ts for ts, _ in self.index], start_ms) - 1
+        return self.index[pos][1] if pos >= 0 else 0
+
+
+class IntrusionEventStore:
+    """
+    Segmented append-only log of intrusion events.
+
+    Records are JSON lines keyed by server receive time (stored_at_ms, kept
+    monotonic). Appends are written immediately but fsynced in batches by a
+    background task. fsync, and closing/sealing a rolled segment, run in a
+    worker thread outside the lock, so append() on the loop never waits on
+    disk. Each segment keeps a sparse time index so range queries seek close
+    to start_ms instead of scanning; sealed segments persist it as a .idx
+    sidecar. Retention deletes whole sealed segments.
+    """
+
+    def __init__(self, directory: str = EVENT_STORE_DIR) -> None:
+        self.directory = directory
+        self._segments: list[_Segment] = []
+        self._f = None
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self._retired: list = []  # (file, segment) rolled on the loop, fsynced/closed/sealed by the flusher
+        self._last_ts = 0
+        self._kick = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    # ---- lifecycle ----
+
+    def open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("seg-") and n.endswith(".jsonl"))
+        for i, name in enumerate(names):
+            seg = _Segment(os.path.join(self.directory, name))
+            active = i == len(names) - 1
+            if active or not self._load_index(seg):
+                self._scan(seg, repair=active)
+            self._segments.append(seg)
+            if seg.last_ts is not None:
+                self._last_ts = max(self._last_ts, seg.last_ts)
+
+        if self._segments:
+            self._f = open(self._segments[-1].path, "ab")
+        else:
+            self._roll(int(time.time() * 1000))
+
+        print(f"[STORE] opened dir={self.directory} segments={len(self._segments)} last_ts={self._last_ts}")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._flusher())
+
+    async def close(self) -> None:
+        # let the flusher finish its current sync instead of cancelling it mid-fsync
+        self._closing = True
+        self._kick.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await asyncio.to_thread(self._close_active)
+
+    def _close_active(self) -> None:
+        self._sync()
+        with self._lock:
+            f, self._f = self._f, None
+        if f:
+            os.fsync(f.fileno())
+            f.close()
+
+    def _load_index(self, seg: _Segment) -> bool:
+        try:
+            with open(seg.idx_path, "r") as f:
+                meta = json.load(f)
+            seg.first_ts, seg.last_ts = meta["first_ts"], meta["last_ts"]
+            seg.size, seg.count = meta["size"], meta["count"]
+            seg.index = [tuple(x) for x in meta["index"]]
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _scan(self, seg: _Segment, repair: bool) -> None:
+        offset = 0
+        with open(seg.path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("torn write")
+                    ts = json.loads(line)["stored_at_ms"]
+                except (ValueError, KeyError):
+                    break
+                seg.note(ts, offset, len(line))
+                offset += len(line)
+        if repair and os.path.getsize(seg.path) > offset:
+            # drop a partial trailing record left by a crash mid-append
+            print(f"[STORE] truncating torn tail of {seg.path} at {offset}")
+            with open(seg.path, "r+b") as f:
+                f.truncate(offset)
+
+    def _seal(self, seg: _Segment) -> None:
+        tmp = seg.idx_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "first_ts": seg.first_ts, "last_ts": seg.last_ts,
+                "size": seg.size, "count": seg.count, "index": seg.index,
+            }, f)
+        os.replace(tmp, seg.idx_path)
+
+    def _roll(self, ts: int) -> None:
+        if self._f:
+            # already flushed by append(); fsync, close and .idx are left to the flusher thread
+            self._retired.append((self._f, self._segments[-1]))
+            self._kick.set()
+        path = os.path.join(self.directory, f"seg-{ts:015d}.jsonl")
+        while os.path.exists(path):
+            # several rolls within one millisecond; names only need to sort in order
+            ts += 1
+            path = os.path.join(self.directory, f"seg-{ts:015d}.jsonl")
+        seg = _Segment(path)
+        self._segments.append(seg)
+        self._f = open(seg.path, "ab")
+        self._dirty = 0
+
+    # ---- write path ----
+
+    def append(self, event: dict) -> dict:
+        ts = max(int(time.time() * 1000), self._last_ts)
+        self._last_ts = ts
+        record = {"stored_at_ms": ts, "event": event}
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+        with self._lock:
+            seg = self._segments[-1]
+            if seg.count and (
+                seg.size + len(line) > EVENT_SEGMENT_MAX_BYTES
+                or ts - (seg.first_ts or ts) > EVENT_SEGMENT_MAX_AGE_S * 1000
+            ):
+                self._roll(ts)
+                seg = self._segments[-1]
+            offset = seg.size
+            self._f.write(line)
+            self._f.flush()  # visible to readers now; durable at the next batched fsync
+            seg.note(ts, offset, len(line))
+            self._dirty += 1
+
+        if self._dirty >= EVENT_FSYNC_BATCH:
+            self._kick.set()
+        return record
+
+    def _sync(self) -> None:
+        # only grab what to sync under the lock; the fsync itself must not hold up append()
+        with self._lock:
+            f = self._f if self._dirty else None
+            self._dirty = 0
+            retired, self._retired = self._retired, []
+        if f:
+            # only this thread closes files, so f stays open for the fsync
+            os.fsync(f.fileno())
+        for old, seg in retired:
+            os.fsync(old.fileno())
+            old.close()
+            self._seal(seg)
+
+    async def _flusher(self) -> None:
+        last_compact = 0.0
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._kick.wait(), timeout=EVENT_FSYNC_INTERVAL_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._kick.clear()
+            try:
+                await asyncio.to_thread(self._sync)
+                if time.time() - last_compact > 600:
+                    last_compact = time.time()
+                    await asyncio.to_thread(self.compact)
+            except Exception as e:
+                print(f"[STORE] flusher error {type(e).__name__}: {e}")
+
+    # ---- read path ----
+
+    def query(
+        self,
+        start_ms: int,
+        end_ms: int,
+        device_id: Optional[str] = None,
+        event_type: Optional[str] = None,
+        limit: int = 500,
+    ) -> dict:
+        """Blocking; call via asyncio.to_thread. Oldest first, bounded by limit."""
+        with self._lock:
+            segs = [
+                (s.path, s.start_offset(start_ms), s.size) for s in self._segments
+                if s.count and s.last_ts >= start_ms and s.first_ts <= end_ms
+            ]
+
+        out: list[dict] = []
+        truncated = False
+        for path, offset, size in segs:
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue  # removed by compaction since we listed it
+            with f:
+                f.seek(offset)
+                pos = offset
+                for line in f:
+                    pos += len(line)
+                    if pos > size:
+                        break  # appended after we snapshotted the segment list
+                    rec = json.loads(line)
+                    ts = rec["stored_at_ms"]
+                    if ts < start_ms:
+                        continue
+                    if ts > end_ms:
+                        break
+                    ev = rec["event"]
+                    if device_id and ev.get("device_id") != device_id:
+                        continue
+                    if event_type and ev.get("event_type") != event_type:
+                        continue
+                    if len(out) >= limit:
+                        truncated = True
+                        break
+                    out.append(rec)
+            if truncated:
+                break
+        return {"events": out, "count": len(out), "truncated": truncated}
+
+    # ---- retention ----
+
+    def compact(self, now_ms: Optional[int] = None) -> int:
+        """Delete sealed segments whose newest record is past retention. Returns segments removed."""
+        now_ms = now_ms or int(time.time() * 1000)
+        cutoff = now_ms - int(EVENT_RETENTION_DAYS * 86400 * 1000)
+        with self._lock:
+            expired = [s for s in self._segments[:-1] if s.last_ts is None or s.last_ts < cutoff]
+            self._segments = [s for s in self._segments if s not in expired]
+        for s in expired:
+            for p in (s.path, s.idx_path):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+        if expired:
+            print(f"[STORE] compacted {len(expired)} segment(s) older than {EVENT_RETENTION_DAYS} days")
+        return len(expired)
+
+
+store = IntrusionEventStore()
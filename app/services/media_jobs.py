@@ -0,0 +1,278 @@
+# app/services/media_jobs.py
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from dotenv import load_dotenv
+
+from app.services.event_feed import feed
+
+load_dotenv()
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+MEDIA_QUEUE_MAXSIZE = int(os.getenv("MEDIA_QUEUE_MAXSIZE", "100"))
+MEDIA_JOB_TIMEOUT_S = float(os.getenv("MEDIA_JOB_TIMEOUT_S", "60"))
+MEDIA_JOB_RETRIES = int(os.getenv("MEDIA_JOB_RETRIES", "2"))
+MEDIA_PREVIEW_MAX_PX = int(os.getenv("MEDIA_PREVIEW_MAX_PX", "640"))
+MEDIA_RESULTS_KEEP = 1000
+# ffprobe + ffmpeg share one job's budget and finish (or are killed) before the job itself times out
+_SUBPROCESS_TIMEOUT_S = MEDIA_JOB_TIMEOUT_S / 3
+
+
+def previews_dir(saved_to: str) -> str:
+    return os.path.join(os.path.dirname(saved_to), "previews")
+
+def preview_path(saved_to: str) -> str:
+    return os.path.join(previews_dir(saved_to), os.path.basename(saved_to) + ".preview.jpg")
+
+def meta_path(saved_to: str) -> str:
+    return os.path.join(previews_dir(saved_to), os.path.basename(saved_to) + ".json")
+
+
+# ---- worker-side functions (run in the process pool; must stay top-level/picklable) ----
+
+def _gps_decimal(dms, ref) -> Optional[float]:
+    try:
+        d, m, s = (float(x) for x in dms)
+    except (TypeError, ValueError):
+        return None
+    v = d + m / 60.0 + s / 3600.0
+    return -v if ref in ("S", "W") else v
+
+def process_photo(path: str, preview: str, max_px: int) -> dict:
+    from PIL import Image, ImageOps  # imported in the worker only
+
+    with Image.open(path) as img:
+        width, height = img.size
+        exif = img.getexif()
+        exif_ifd = exif.get_ifd(0x8769)
+        gps_ifd = exif.get_ifd(0x8825)
+
+        meta = {
+            "width": width,
+            "height": height,
+            "format": img.format,
+            "make": exif.get(271),
+            "model": exif.get(272),
+            "taken_at": exif_ifd.get(36867) or exif.get(306),
+        }
+        if gps_ifd:
+            lat = _gps_decimal(gps_ifd.get(2), gps_ifd.get(1))
+            lon = _gps_decimal(gps_ifd.get(4), gps_ifd.get(3))
+            alt = gps_ifd.get(6)
+            meta["gps"] = {
+                "lat": lat,
+                "lon": lon,
+                "alt_m": float(alt) if alt is not None else None,
+            }
+
+        # draft() lets the JPEG decoder downscale while decoding, far cheaper than a full 12 MP decode
+        img.draft("RGB", (max_px, max_px))
+        thumb = ImageOps.exif_transpose(img)
+        thumb.thumbnail((max_px, max_px))
+        os.makedirs(os.path.dirname(preview), exist_ok=True)
+        thumb.convert("RGB").save(preview, "JPEG", quality=80, optimize=True)
+
+    meta["preview"] = preview
+    return meta
+
+def process_video(path: str, poster: str, max_px: int) -> dict:
+    if not shutil.which("ffprobe") or not shutil.which("ffmpeg"):
+        raise RuntimeError("ffmpeg/ffprobe not available")
+
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True, text=True, timeout=_SUBPROCESS_TIMEOUT_S, check=True,
+    )
+    info = json.loads(probe.stdout or "{}")
+    video = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), {})
+    duration = float(info.get("format", {}).get("duration") or video.get("duration") or 0.0)
+
+    meta = {
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "codec": video.get("codec_name"),
+        "duration_s": duration,
+        "format": info.get("format", {}).get("format_name"),
+    }
+
+    os.makedirs(os.path.dirname(poster), exist_ok=True)
+    seek = min(1.0, duration / 2) if duration else 0.0
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", "-ss", f"{seek:.2f}", "-i", path, "-frames:v", "1",
+         "-vf", f"scale='min({max_px},iw)':-2", poster],
+        capture_output=True, timeout=_SUBPROCESS_TIMEOUT_S, check=True,
+    )
+    meta["preview"] = poster
+    return meta
+
+_PROCESSORS = {"photo": process_photo, "video": process_video}
+
+
+# ---- server side ----
+
+# worth another attempt; decode errors, bad files and missing ffmpeg fail straight away
+_TRANSIENT = (asyncio.TimeoutError, BrokenProcessPool)
+
+def _new_pool() -> ProcessPoolExecutor:
+    # workers start lazily, after to_thread threads exist; forking a threaded process can deadlock the child
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("forkserver"))
+
+def _kill_pool(pool: ProcessPoolExecutor) -> None:
+    # shutdown() alone leaves a hung decode running; terminate the worker process itself
+    for proc in list((pool._processes or {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+class MediaJobQueue:
+    """
+    Bounded queue of post-processing jobs for completed uploads, executed in
+    worker processes so decoding never blocks the event loop.
+
+    Each of the MEDIA_WORKERS consumers owns a single-process pool. A job that
+    exceeds MEDIA_JOB_TIMEOUT_S (or kills its worker) gets that process
+    terminated and the pool replaced, without touching the other consumers.
+
+    submit() never waits: when the queue is full the job is recorded as
+    "rejected" (backpressure) instead of piling up. Timeouts and crashed
+    workers are retried with backoff up to MEDIA_JOB_RETRIES times; other
+    errors fail immediately. Each job records queue and run time.
+    Results are kept in memory (bounded) and as a JSON sidecar next to the preview.
+    """
+
+    def __init__(self) -> None:
+        self._pools: list[ProcessPoolExecutor] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self.results: "OrderedDict[str, dict]" = OrderedDict()
+        self.stats = {"done": 0, "failed": 0, "rejected": 0, "retried": 0}
+
+    def start(self) -> None:
+        self._pools = [_new_pool() for _ in range(MEDIA_WORKERS)]
+        self._queue = asyncio.Queue(maxsize=MEDIA_QUEUE_MAXSIZE)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(MEDIA_WORKERS)]
+        print(f"[MEDIA] started workers={MEDIA_WORKERS} queue={MEDIA_QUEUE_MAXSIZE}")
+
+    async def stop(self) -> None:
+        for t in self._workers:
+            t.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for pool in self._pools:
+            _kill_pool(pool)
+        self._pools = []
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _remember(self, rec: dict) -> None:
+        self.results[rec["saved_to"]] = rec
+        self.results.move_to_end(rec["saved_to"])
+        while len(self.results) > MEDIA_RESULTS_KEEP:
+            self.results.popitem(last=False)
+
+    def submit(self, saved_to: str, media: str, device_id: str) -> dict:
+        rec = {
+            "saved_to": saved_to,
+            "media": media,
+            "device_id": device_id,
+            "status": "queued",
+            "enqueued_at_ms": int(time.time() * 1000),
+            "attempts": 0,
+        }
+        if self._queue is None or media not in _PROCESSORS:
+            rec["status"] = "skipped"
+        else:
+            try:
+                self._queue.put_nowait(rec)
+            except asyncio.QueueFull:
+                rec["status"] = "rejected"
+                self.stats["rejected"] += 1
+                print(f"[MEDIA] queue full, rejected {saved_to}")
+        self._remember(rec)
+        return rec
+
+    def lookup(self, saved_to: str) -> Optional[dict]:
+        rec = self.results.get(saved_to)
+        if rec is not None:
+            return rec
+        try:
+            with open(meta_path(saved_to), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def _run_once(self, rec: dict, n: int) -> dict:
+        loop = asyncio.get_running_loop()
+        fn = _PROCESSORS[rec["media"]]
+        fut = loop.run_in_executor(self._pools[n], fn, rec["saved_to"], preview_path(rec["saved_to"]), MEDIA_PREVIEW_MAX_PX)
+        try:
+            return await asyncio.wait_for(fut, timeout=MEDIA_JOB_TIMEOUT_S)
+        except _TRANSIENT:
+            # timed out (still running) or the worker died: either way this pool is unusable
+            _kill_pool(self._pools[n])
+            self._pools[n] = _new_pool()
+            raise
+
+    async def _worker(self, n: int) -> None:
+        assert self._queue is not None
+        while True:
+            rec = await self._queue.get()
+            started = time.time()
+            rec["status"] = "running"
+            rec["queued_ms"] = int(started * 1000) - rec["enqueued_at_ms"]
+            try:
+                for attempt in range(MEDIA_JOB_RETRIES + 1):
+                    rec["attempts"] = attempt + 1
+                    try:
+                        rec["meta"] = await self._run_once(rec, n)
+                        rec["status"] = "done"
+                        rec.pop("error", None)
+                        break
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        rec["error"] = f"{type(e).__name__}: {e}"
+                        if not isinstance(e, _TRANSIENT):
+                            rec["status"] = "failed"
+                            break
+                        if attempt < MEDIA_JOB_RETRIES:
+                            self.stats["retried"] += 1
+                            await asyncio.sleep(0.5 * (2 ** attempt))
+                else:
+                    rec["status"] = "failed"
+
+                rec["run_ms"] = int((time.time() - started) * 1000)
+                self.stats["done" if rec["status"] == "done" else "failed"] += 1
+                print(f"[MEDIA] {rec['status']} {rec['saved_to']} attempts={rec['attempts']} queued_ms={rec['queued_ms']} run_ms={rec['run_ms']} error={rec.get('error')}")
+                await asyncio.to_thread(self._write_sidecar, rec)
+                feed.publish(
+                    "media",
+                    {"saved_to": rec["saved_to"], "media": rec["media"], "status": rec["status"], "preview": (rec.get("meta") or {}).get("preview")},
+                    device_id=rec["device_id"],
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[MEDIA] worker {n} error {type(e).__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _write_sidecar(rec: dict) -> None:
+        p = meta_path(rec["saved_to"])
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = p + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(rec, f, default=str)
+        os.replace(tmp, p)
+
+
+media_jobs = MediaJobQueue()
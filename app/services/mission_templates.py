@@ -0,0 +1,227 @@
+# app/services/mission_templates.py
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional, get_args
+from dotenv import load_dotenv
+
+from app.schemas.models import EventType
+from app.services.sse_broker import is_safety
+
+load_dotenv()
+
+MISSION_TEMPLATES_PATH = os.getenv("MISSION_TEMPLATES_PATH", "./config/missions.json")
+MISSION_TEMPLATES_POLL_S = float(os.getenv("MISSION_TEMPLATES_POLL_S", "2"))
+
+EVENT_TYPES = get_args(EventType)
+
+# used when the config file is missing: the original hardcoded intrusion pattern
+BUILTIN_CONFIG = {
+    "default": "patrol_cross",
+    "templates": {
+        "patrol_cross": {
+            "steps": [
+                {"cmd_type": "VS_ENABLE", "payload": {"enabled": True, "reason": "intrusion"}},
+                {"cmd_type": "MOVE_SEQUENCE", "payload": {
+                    "moves": [
+                        {"leftX": 0, "leftY": 0, "rightX": 0, "rightY": 0.25, "durationMs": 800, "hz": 25},
+                        {"leftX": 0, "leftY": 0, "rightX": 0, "rightY": -0.25, "durationMs": 800, "hz": 25},
+                        {"leftX": 0, "leftY": 0, "rightX": 0.25, "rightY": 0, "durationMs": 800, "hz": 25},
+                        {"leftX": 0, "leftY": 0, "rightX": -0.25, "rightY": 0, "durationMs": 800, "hz": 25},
+                    ],
+                    "defaultHz": 25,
+                }},
+                {"cmd_type": "SNAPSHOT", "payload": {}},
+            ],
+        },
+    },
+    "cameras": {},
+}
+
+
+class MissionTemplate:
+    __slots__ = ("name", "device_id", "steps")
+
+    def __init__(self, name: str, device_id: Optional[str], steps: tuple) -> None:
+        self.name = name
+        self.device_id = device_id      # controller to fly; None = DRONE_DEVICE_ID
+        self.steps = steps              # ((cmd_type, payload), ...) ready to enqueue; never mutate payloads
+
+
+class _Compiled:
+    def __init__(self, by_key: Dict[tuple, MissionTemplate], by_event: Dict[str, MissionTemplate], source: str) -> None:
+        self.by_key = by_key        # (camera, event_type) -> template, for configured cameras
+        self.by_event = by_event    # event_type -> template, for everything else
+        self.source = source
+        self.loaded_at_ms = int(time.time() * 1000)
+
+
+def compile_config(cfg: dict, source: str) -> _Compiled:
+    """
+    Config:
+      {
+        "default": "<template>",
+        "templates": {"<name>": {"device_id": "...optional...", "steps": [{"cmd_type": "...", "payload": {...}}]}},
+        "events":  {"<event_type>": "<template>"},                       # optional, all cameras
+        "cameras": {"<camera>": {"*": "<template>", "<event_type>": "<template>"}}
+      }
+    Every (camera, event_type) is resolved here so dispatch is one or two dict lookups.
+    Raises ValueError on anything malformed, including wrong JSON types.
+    """
+    def obj(v, where: str) -> dict:
+        if v is None:
+            return {}
+        if not isinstance(v, dict):
+            raise ValueError(f"{where}: must be an object, got {type(v).__name__}")
+        return v
+
+    def event_type(et, where: str) -> str:
+        if et not in EVENT_TYPES:
+            raise ValueError(f"{where}: unknown event_type {et!r}")
+        return et
+
+    cfg = obj(cfg, "config")
+    templates: Dict[str, MissionTemplate] = {}
+    for name, t in obj(cfg.get("templates"), "templates").items():
+        t = obj(t, f"template {name}")
+        raw_steps = t.get("steps") or []
+        if not isinstance(raw_steps, list):
+            raise ValueError(f"template {name}: steps must be a list")
+        device_id = t.get("device_id")
+        if device_id is not None and not isinstance(device_id, str):
+            raise ValueError(f"template {name}: device_id must be a string")
+        steps = []
+        for i, step in enumerate(raw_steps):
+            step = obj(step, f"template {name} step {i}")
+            cmd_type = step.get("cmd_type")
+            payload = step.get("payload") or {}
+            if not isinstance(cmd_type, str) or not cmd_type:
+                raise ValueError(f"template {name} step {i}: missing cmd_type")
+            if not isinstance(payload, dict):
+                raise ValueError(f"template {name} step {i}: payload must be an object")
+            if is_safety({"cmd_type": cmd_type, "payload": payload}):
+                # steps are enqueued back to back, so a safety step would jump the safety lane
+                # ahead of the mission and flush its own earlier steps
+                raise ValueError(
+                    f"template {name} step {i}: {cmd_type} is a safety command and cannot be a mission step; "
+                    "send it with /v1/drone/send"
+                )
+            if cmd_type == "MOVE_SEQUENCE" and not isinstance(payload.get("moves"), list):
+                raise ValueError(f"template {name} step {i}: MOVE_SEQUENCE needs a moves list")
+            steps.append((cmd_type, payload))
+        if not steps:
+            raise ValueError(f"template {name}: no steps")
+        templates[name] = MissionTemplate(name, device_id, tuple(steps))
+
+    def ref(name, where: str) -> MissionTemplate:
+        if not isinstance(name, str) or name not in templates:
+            raise ValueError(f"{where}: unknown template {name!r}")
+        return templates[name]
+
+    default = ref(cfg.get("default"), "default")
+    by_event = {et: default for et in EVENT_TYPES}
+    for et, name in obj(cfg.get("events"), "events").items():
+        by_event[event_type(et, "events")] = ref(name, f"events.{et}")
+
+    by_key: Dict[tuple, MissionTemplate] = {}
+    for cam, mapping in obj(cfg.get("cameras"), "cameras").items():
+        mapping = obj(mapping, f"cameras.{cam}")
+        for et in mapping:
+            if et != "*":
+                event_type(et, f"cameras.{cam}")
+        cam_default = mapping.get("*")
+        for et in EVENT_TYPES:
+            name = mapping.get(et) or cam_default
+            by_key[(cam, et)] = ref(name, f"cameras.{cam}") if name else by_event[et]
+
+    return _Compiled(by_key, by_event, source)
+
+
+class MissionTemplateCache:
+    """
+    Per-camera mission templates, precompiled and swapped atomically on reload.
+
+    A watcher task polls the config file's mtime/size; a changed file is parsed
+    and compiled off the loop and only replaces the live cache if it is valid,
+    so a bad edit keeps the previous templates running.
+    """
+
+    def __init__(self, path: str = MISSION_TEMPLATES_PATH) -> None:
+        self.path = path
+        self._compiled = compile_config(BUILTIN_CONFIG, "builtin")
+        self._sig: Optional[tuple] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def lookup(self, camera: Optional[str], event_type: Optional[str]) -> MissionTemplate:
+        c = self._compiled
+        return c.by_key.get((camera, event_type)) or c.by_event.get(event_type) or c.by_event[EVENT_TYPES[0]]
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self) -> _Compiled:
+        with open(self.path, "r") as f:
+            cfg = json.load(f)
+        return compile_config(cfg, self.path)
+
+    async def reload_if_changed(self) -> bool:
+        sig = self._stat()
+        if sig == self._sig:
+            return False
+        self._sig = sig
+        if sig is None:
+            print(f"[MISSION] {self.path} not found, keeping {self._compiled.source} templates")
+            return False
+        try:
+            compiled = await asyncio.to_thread(self._load)
+        except (OSError, ValueError) as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[MISSION] reload failed, keeping previous templates: {self.last_error}")
+            return False
+        self._compiled = compiled  # single reference swap; in-flight dispatches keep the old object
+        self.last_error = None
+        print(f"[MISSION] loaded {self.path} cameras={len({k[0] for k in compiled.by_key})}")
+        return True
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self) -> None:
+        while True:
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"[MISSION] watcher error, keeping previous templates: {self.last_error}")
+            await asyncio.sleep(MISSION_TEMPLATES_POLL_S)
+
+    def status(self) -> dict:
+        c = self._compiled
+        return {
+            "source": c.source,
+            "loaded_at_ms": c.loaded_at_ms,
+            "last_error": self.last_error,
+            "defaults": {et: t.name for et, t in c.by_event.items()},
+            "cameras": {
+                cam: {et: c.by_key[(cam, et)].name for et in EVENT_TYPES}
+                for cam in sorted({k[0] for k in c.by_key})
+            },
+        }
+
+
+mission_templates = MissionTemplateCache()
@@ -19,3 +19,11 @@ def allow(device_id: str) -> bool:
         return False
     q.append(now)
     return True
+
+def export_state() -> dict:
+    return {"hits": {k: list(v) for k, v in _hits.items() if v}}
+
+def restore_state(state: dict) -> None:
+    now = time.time()
+    for device_id, ts in (state.get("hits") or {}).items():
+        _hits[device_id] = deque(t for t in ts if now - t <= WINDOW_SECONDS)
@@ -1,32 +1,173 @@
 # app/services/sse_broker.py
 import asyncio
 import json
+import os
 import time
-from typing import Dict, Any
-
-class DroneSseBroker:
-    def __init__(self):
-        self._queues: dict[str, asyncio.Queue] = {}
-        self._lock = asyncio.Lock()
-
-    async def get_queue(self, device_id: str) -> asyncio.Queue:
-        async with self._lock:
-            q = self._queues.get(device_id)
-            if q is None:
-                q = asyncio.Queue(maxsize=200)
-                self._queues[device_id] = q
-            return q
-
-    async def publish(self, device_id: str, msg: Dict[str, Any]) -> None:
-        q = await self.get_queue(device_id)
-        try:
-            q.put_nowait(msg)
-        except asyncio.QueueFull:
-            # drop oldest, keep latest behavior
-            _ = q.get_nowait()
-            q.put_nowait(msg)
-
-broker = DroneSseBroker()
+from collections import Counter, deque
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# What to do when a subscriber queue is full (or, for coalesce, when an older
+# command with the same key is still undelivered).
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_DROP_NEWEST = "drop_newest"
+POLICY_DISCONNECT = "disconnect"      # evict the slow consumer; it reconnects with a fresh queue
+POLICY_COALESCE = "coalesce"          # newer cmd replaces undelivered older cmd with same cmd_type
+
+POLICIES = (POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_DISCONNECT, POLICY_COALESCE)
+
+def _parse_policy_map(raw: str) -> Dict[str, str]:
+    # "MOVE_SEQUENCE=coalesce,LIVESTREAM_START=coalesce"
+    out: Dict[str, str] = {}
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        k, v = (x.strip() for x in part.split("=", 1))
+        if k and v in POLICIES:
+            out[k] = v
+        elif k:
+            print(f"[SSE] ignoring unknown queue policy {k}={v}")
+    return out
+
+SSE_QUEUE_MAXSIZE = int(os.getenv("SSE_QUEUE_MAXSIZE", "200"))
+SSE_QUEUE_POLICY = os.getenv("SSE_QUEUE_POLICY", POLICY_DROP_OLDEST)
+SSE_QUEUE_POLICY_BY_DEVICE = _parse_policy_map(os.getenv("SSE_QUEUE_POLICY_BY_DEVICE", ""))
+SSE_QUEUE_POLICY_BY_CMD = _parse_policy_map(
+    os.getenv("SSE_QUEUE_POLICY_BY_CMD", "MOVE_SEQUENCE=coalesce,LIVESTREAM_START=coalesce")
+)
+
+# Safety lane: delivered ahead of everything, never dropped for capacity, never coalesced.
+SSE_SAFETY_CMD_TYPES = {
+    c.strip() for c in os.getenv("SSE_SAFETY_CMD_TYPES", "STOP,VS_STOP,EMERGENCY_STOP,RETURN_HOME,GO_HOME,LAND").split(",")
+    if c.strip()
+}
+# if true, a safety command discards everything still queued in the normal lane
+SSE_SAFETY_FLUSH = (os.getenv("SSE_SAFETY_FLUSH", "true").lower() == "true")
+
+if SSE_QUEUE_POLICY not in POLICIES:
+    print(f"[SSE] unknown SSE_QUEUE_POLICY={SSE_QUEUE_POLICY}, using {POLICY_DROP_OLDEST}")
+    SSE_QUEUE_POLICY = POLICY_DROP_OLDEST
+
+def resolve_policy(device_id: str, cmd_type: str) -> str:
+    """cmd_type override wins, then device override, then the global default."""
+    return (
+        SSE_QUEUE_POLICY_BY_CMD.get(cmd_type)
+        or SSE_QUEUE_POLICY_BY_DEVICE.get(device_id)
+        or SSE_QUEUE_POLICY
+    )
+
+def is_safety(cmd: Dict[str, Any]) -> bool:
+    cmd_type = cmd.get("cmd_type")
+    if cmd_type in SSE_SAFETY_CMD_TYPES:
+        return True
+    # VS_ENABLE false hands control back to the pilot / stops virtual stick
+    return cmd_type == "VS_ENABLE" and (cmd.get("payload") or {}).get("enabled") is False
+
+# device_id -> Counter(reason -> dropped commands), across all subscribers
+drop_stats: Dict[str, Counter] = {}
+
+
+class CommandQueue:
+    """
+    Per-subscriber command queue used by /v1/drone/stream.
+
+    Two lanes: safety commands (see is_safety) and everything else. get() always
+    drains the safety lane first, so stop latency does not depend on queue depth.
+
+    put() never blocks; it applies the policy for (device_id, cmd_type) and
+    returns the commands it dropped as [(cmd, reason), ...] so the caller can
+    record them.
+    """
+
+    def __init__(self, device_id: str, maxsize: int = SSE_QUEUE_MAXSIZE) -> None:
+        self.device_id = device_id
+        self.maxsize = maxsize
+        self.closed = False
+        self._safety: deque = deque()
+        self._items: deque = deque()
+        self._wake = asyncio.Event()
+
+    def qsize(self) -> int:
+        return len(self._safety) + len(self._items)
+
+    def _record(self, dropped: list) -> list:
+        if dropped:
+            c = drop_stats.setdefault(self.device_id, Counter())
+            for _, reason in dropped:
+                c[reason] += 1
+        return dropped
+
+    def put(self, cmd: Dict[str, Any]) -> list:
+        # safety commands are accepted even on an evicted queue: get() still hands them out,
+        # and whatever the stream did not send is carried to the next connection (take_safety)
+        if is_safety(cmd):
+            dropped = []
+            if SSE_SAFETY_FLUSH:
+                dropped = [(c, "flushed_by_safety") for c in self._items]
+                self._items.clear()
+            # capacity limits do not apply to the safety lane
+            self._safety.append(cmd)
+            self._wake.set()
+            return self._record(dropped)
+
+        if self.closed:
+            return self._record([(cmd, "closed")])
+
+        cmd_type = cmd.get("cmd_type")
+        policy = resolve_policy(self.device_id, cmd_type)
+        dropped: list = []
+
+        if policy == POLICY_COALESCE:
+            for old in [c for c in self._items if c.get("cmd_type") == cmd_type]:
+                self._items.remove(old)
+                dropped.append((old, "superseded"))
+            # coalescing only handles same-key commands; capacity falls back to the device/global policy
+            policy = SSE_QUEUE_POLICY_BY_DEVICE.get(self.device_id) or SSE_QUEUE_POLICY
+            if policy == POLICY_COALESCE:
+                policy = POLICY_DROP_OLDEST
+
+        if len(self._items) >= self.maxsize:
+            if policy == POLICY_DROP_NEWEST:
+                dropped.append((cmd, "queue_full"))
+                return self._record(dropped)
+            if policy == POLICY_DISCONNECT:
+                self.closed = True
+                dropped.extend((c, "slow_consumer") for c in self._items)
+                dropped.append((cmd, "slow_consumer"))
+                self._items.clear()
+                self._wake.set()
+                return self._record(dropped)
+            dropped.append((self._items.popleft(), "queue_full"))
+
+        self._items.append(cmd)
+        self._wake.set()
+        return self._record(dropped)
+
+    def take_safety(self) -> list:
+        """Safety commands still queued when the stream ends; never dropped, so the caller re-homes them."""
+        left = list(self._safety)
+        self._safety.clear()
+        return left
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next command, or None on timeout or once the queue has been closed."""
+        if not self.qsize() and not self.closed:
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        # safety commands still go out on an evicted queue before the stream closes
+        if self._safety:
+            return self._safety.popleft()
+        if self.closed:
+            return None
+        if self._items:
+            return self._items.popleft()
+        return None
+
 
 def sse_event(event: str, data: dict) -> str:
     # SSE wire format
@@ -0,0 +1,53 @@
+# app/services/state_snapshot.py
+import json
+import os
+import time
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATE_SNAPSHOT_PATH = os.getenv("STATE_SNAPSHOT_PATH", "./data/state.json")
+# how long shutdown waits for in-flight mission dispatch tasks before writing the snapshot
+STATE_SHUTDOWN_DEADLINE_S = float(os.getenv("STATE_SHUTDOWN_DEADLINE_S", "3"))
+# unacked commands older than this are not redelivered after a restart
+STATE_REPLAY_MAX_AGE_S = float(os.getenv("STATE_REPLAY_MAX_AGE_S", "300"))
+
+SNAPSHOT_VERSION = 1
+
+
+def save(sections: dict, path: str = STATE_SNAPSHOT_PATH) -> None:
+    """Atomically write {section: state} (tmp file + fsync + rename)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    doc = {"version": SNAPSHOT_VERSION, "saved_at_ms": int(time.time() * 1000), "sections": sections}
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(doc, f, separators=(",", ":"), default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    print(f"[STATE] snapshot written path={path} sections={sorted(sections)}")
+
+
+def load(path: str = STATE_SNAPSHOT_PATH) -> Optional[dict]:
+    """
+    Returns the sections of the last snapshot, or None. The file is moved aside
+    once read so a later crash (no graceful snapshot) cannot replay it twice.
+    """
+    try:
+        with open(path, "r") as f:
+            doc = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"[STATE] ignoring unreadable snapshot {path}: {type(e).__name__}: {e}")
+        return None
+
+    os.replace(path, path + ".prev")
+    if doc.get("version") != SNAPSHOT_VERSION:
+        print(f"[STATE] ignoring snapshot version={doc.get('version')}")
+        return None
+
+    age_s = (time.time() * 1000 - doc.get("saved_at_ms", 0)) / 1000
+    print(f"[STATE] loaded snapshot path={path} age_s={age_s:.1f}")
+    return doc.get("sections") or {}
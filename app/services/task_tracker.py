@@ -0,0 +1,45 @@
+# app/services/task_tracker.py
+import asyncio
+import time
+from typing import Coroutine, Set
+
+
+class TaskTracker:
+    """
+    Keeps references to fire-and-forget tasks (e.g. intrusion mission dispatch)
+    so they can be counted and drained on shutdown. BackgroundTasks gives us
+    neither.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._tasks: Set[asyncio.Task] = set()
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        t = asyncio.create_task(coro)
+        self._tasks.add(t)
+        t.add_done_callback(self._done)
+        return t
+
+    def _done(self, t: asyncio.Task) -> None:
+        self._tasks.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            e = t.exception()
+            print(f"[TASK] {self.name} task failed {type(e).__name__}: {e}")
+
+    def inflight(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, timeout_s: float) -> int:
+        """Wait up to timeout_s for in-flight tasks; cancel the rest. Returns how many were cancelled."""
+        if not self._tasks:
+            return 0
+        start = time.time()
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout_s)
+        for t in pending:
+            t.cancel()
+        print(f"[TASK] {self.name} drained in {int((time.time() - start) * 1000)}ms cancelled={len(pending)}")
+        return len(pending)
+
+
+dispatch_tasks = TaskTracker("dispatch")
@@ -0,0 +1,144 @@
+# app/services/tracing.py
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "500"))
+TRACE_STAGE_SAMPLES = int(os.getenv("TRACE_STAGE_SAMPLES", "1000"))
+_CMD_KEEP = 5000
+
+# waterfall order; a trace only has the stages it actually went through
+STAGES = ("intake", "settle", "queue", "sse_delivery", "ack", "controller_exec", "upload")
+
+def _now_ms() -> float:
+    return time.time() * 1000
+
+def _pct(sorted_vals: list, p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * (len(sorted_vals) - 1)))))
+    return round(sorted_vals[i], 1)
+
+
+class Tracer:
+    """
+    In-memory mission tracing from intrusion intake to the SNAPSHOT upload.
+
+    A trace id is carried in command payloads (payload.trace_id) and upload URLs
+    (?trace_id=&command_id=); acks are matched back through command_id. Spans are
+    (stage, start_ms, end_ms). Only the last TRACE_KEEP traces and
+    TRACE_STAGE_SAMPLES durations per stage are kept.
+    """
+
+    def __init__(self) -> None:
+        self._traces: "OrderedDict[str, dict]" = OrderedDict()
+        self._cmds: "OrderedDict[str, dict]" = OrderedDict()  # command_id -> {trace_id, cmd_type, enqueued/delivered/acked ms}
+        self._samples: Dict[str, deque] = {s: deque(maxlen=TRACE_STAGE_SAMPLES) for s in STAGES}
+
+    # ---- recording ----
+
+    def start(self, trace_id: Optional[str] = None, started_ms: Optional[float] = None, **attrs) -> str:
+        trace_id = trace_id or uuid.uuid4().hex
+        self._traces[trace_id] = {"trace_id": trace_id, "started_ms": started_ms or _now_ms(), "attrs": attrs, "spans": []}
+        while len(self._traces) > TRACE_KEEP:
+            self._traces.popitem(last=False)
+        return trace_id
+
+    def span(self, trace_id: Optional[str], stage: str, start_ms: float, end_ms: float, **attrs) -> None:
+        t = self._traces.get(trace_id) if trace_id else None
+        if t is None:
+            return
+        dur = max(0.0, end_ms - start_ms)
+        t["spans"].append({"stage": stage, "start_ms": start_ms, "end_ms": end_ms, "duration_ms": round(dur, 1), **attrs})
+        if stage in self._samples:
+            self._samples[stage].append(dur)
+
+    def command_enqueued(self, trace_id: Optional[str], command_id: str, cmd_type: str) -> None:
+        if not trace_id or trace_id not in self._traces:
+            return
+        self._cmds[command_id] = {"trace_id": trace_id, "cmd_type": cmd_type, "enqueued_ms": _now_ms()}
+        while len(self._cmds) > _CMD_KEEP:
+            self._cmds.popitem(last=False)
+
+    def command_delivered(self, command_id: Optional[str], yielded_ms: float, sent_ms: float) -> None:
+        """yielded_ms: frame handed to the SSE stream; sent_ms: stream resumed after writing it."""
+        c = self._cmds.get(command_id) if command_id else None
+        if c is None or "delivered_ms" in c:
+            return
+        c["delivered_ms"] = sent_ms
+        self.span(c["trace_id"], "queue", c["enqueued_ms"], yielded_ms, command_id=command_id, cmd_type=c["cmd_type"])
+        self.span(c["trace_id"], "sse_delivery", yielded_ms, sent_ms, command_id=command_id, cmd_type=c["cmd_type"])
+
+    def command_acked(self, command_id: str, ok: bool, exec_ms: Optional[float] = None) -> None:
+        c = self._cmds.get(command_id)
+        if c is None or "acked_ms" in c:
+            return
+        now = _now_ms()
+        c["acked_ms"] = now
+        start = c.get("delivered_ms", c["enqueued_ms"])
+        self.span(c["trace_id"], "ack", start, now, command_id=command_id, cmd_type=c["cmd_type"], ok=ok)
+        if exec_ms is not None:
+            # controller-reported execution time, placed just before the ack
+            self.span(c["trace_id"], "controller_exec", now - exec_ms, now, command_id=command_id, cmd_type=c["cmd_type"])
+
+    def upload_stored(self, trace_id: Optional[str], command_id: Optional[str], **attrs) -> None:
+        if not trace_id:
+            return
+        now = _now_ms()
+        c = self._cmds.get(command_id) if command_id else None
+        start = c.get("delivered_ms", c["enqueued_ms"]) if c else now
+        self.span(trace_id, "upload", start, now, command_id=command_id, **attrs)
+
+    # ---- reporting ----
+
+    def waterfall(self, trace_id: str) -> Optional[dict]:
+        t = self._traces.get(trace_id)
+        if t is None:
+            return None
+        t0 = t["started_ms"]
+        spans = sorted(t["spans"], key=lambda s: (s["start_ms"], STAGES.index(s["stage"]) if s["stage"] in STAGES else 99))
+        end = max((s["end_ms"] for s in spans), default=t0)
+        by_stage: Dict[str, float] = {}
+        for s in spans:
+            by_stage[s["stage"]] = round(by_stage.get(s["stage"], 0.0) + s["duration_ms"], 1)
+        return {
+            "trace_id": trace_id,
+            "attrs": t["attrs"],
+            "started_ms": int(t0),
+            "total_ms": round(end - t0, 1),
+            "by_stage_ms": by_stage,
+            "spans": [
+                {**s, "offset_ms": round(s["start_ms"] - t0, 1), "start_ms": int(s["start_ms"]), "end_ms": int(s["end_ms"])}
+                for s in spans
+            ],
+        }
+
+    def recent(self, limit: int = 50) -> list:
+        out = []
+        for trace_id in reversed(self._traces):
+            w = self.waterfall(trace_id)
+            out.append({k: w[k] for k in ("trace_id", "attrs", "started_ms", "total_ms", "by_stage_ms")})
+            if len(out) >= limit:
+                break
+        return out
+
+    def percentiles(self) -> dict:
+        out = {}
+        for stage in STAGES:
+            vals = sorted(self._samples[stage])
+            out[stage] = {
+                "count": len(vals),
+                "p50": _pct(vals, 50),
+                "p90": _pct(vals, 90),
+                "p99": _pct(vals, 99),
+                "max": round(vals[-1], 1) if vals else 0.0,
+            }
+        return out
+
+
+tracer = Tracer()
@@ -0,0 +1,78 @@
+# app/services/upload_quota.py
+import os
+import re
+from typing import Dict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_DIR = os.getenv("DRONE_UPLOAD_DIR", "./uploads")
+UPLOAD_QUOTA_BYTES = int(os.getenv("UPLOAD_QUOTA_BYTES", str(5 * 1024 * 1024 * 1024)))
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+def safe_device_dir(device_id: str) -> str:
+    name = _UNSAFE.sub("_", (device_id or "").strip()) or "unknown"
+    return "_" + name if name.startswith(".") else name
+
+
+class UploadQuota:
+    """
+    Per-device disk usage under UPLOAD_DIR/<device_id>/.
+
+    Usage is measured from disk the first time a device is seen, then kept up to
+    date in memory: writers reserve() bytes as they stream and release() them if
+    the upload is abandoned. Everything runs on the event loop, so no locking.
+    """
+
+    def __init__(self, root: str = UPLOAD_DIR, quota_bytes: int = UPLOAD_QUOTA_BYTES) -> None:
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self._used: Dict[str, int] = {}
+
+    def device_dir(self, device_id: str) -> str:
+        return os.path.join(self.root, safe_device_dir(device_id))
+
+    def used(self, device_id: str) -> int:
+        key = safe_device_dir(device_id)
+        if key not in self._used:
+            total = 0
+            d = os.path.join(self.root, key)
+            if os.path.isdir(d):
+                for entry in os.scandir(d):
+                    if entry.is_file() and not entry.name.endswith(".part"):
+                        total += entry.stat().st_size
+            self._used[key] = total
+        return self._used[key]
+
+    def remaining(self, device_id: str) -> int:
+        return max(0, self.quota_bytes - self.used(device_id))
+
+    def reserve(self, device_id: str, nbytes: int) -> bool:
+        if nbytes > self.remaining(device_id):
+            return False
+        self._used[safe_device_dir(device_id)] += nbytes
+        return True
+
+    def release(self, device_id: str, nbytes: int) -> None:
+        key = safe_device_dir(device_id)
+        self._used[key] = max(0, self._used.get(key, 0) - nbytes)
+
+
+quota = UploadQuota()
+
+
+def cleanup_partials(root: str = UPLOAD_DIR) -> int:
+    """Remove .part files left by uploads that were interrupted by a crash or restart."""
+    removed = 0
+    if not os.path.isdir(root):
+        return 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(".part"):
+                try:
+                    os.remove(os.path.join(dirpath, name))
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
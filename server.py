@@ -2,4 +2,5 @@ import uvicorn
 from app.main import app
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8080, reload=True)
\ No newline at end of file
+    # graceful timeout: open SSE streams would otherwise hold shutdown (and the state snapshot) forever
+    uvicorn.run(app, host="0.0.0.0", port=8080, reload=True, timeout_graceful_shutdown=5)
\ No newline at end of file